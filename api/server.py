@@ -1,16 +1,28 @@
 from fastapi import FastAPI, HTTPException, Request, status, Depends, Security
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.security.api_key import APIKeyHeader
 from pydantic import BaseModel, Field
-from contextlib import asynccontextmanager
-from typing import Any
-from functions.embedding_processor import EmbeddingProcessor
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple
+from starlette.middleware.gzip import GZipMiddleware
 
 import config
 import json
+import math
 import time
 import asyncio
 import logging
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -38,6 +50,135 @@ class RateLimiter:
 
 rate_limiter = RateLimiter(requests_per_minute=60)
 
+class ClientDisconnectedError(Exception):
+    pass
+
+class DepartmentQueue:
+    """
+    Slots de processamento de um departamento e a média móvel do tempo de atendimento.
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.semaphore = asyncio.Semaphore(slots)
+        self.in_flight = 0
+        self.waiting = 0
+        self.service_time = config.ADMISSION_INITIAL_SERVICE_TIME
+
+    def estimate_wait(self) -> float:
+        ahead = self.in_flight + self.waiting
+        if ahead < self.slots:
+            return 0.0
+        return (ahead - self.slots + 1) / self.slots * self.service_time
+
+    def record(self, elapsed: float) -> None:
+        self.service_time = 0.8 * self.service_time + 0.2 * elapsed
+
+class AdmissionTicket:
+    """
+    Marca se a requisição admitida terminou normalmente; só essas entram na
+    média do tempo de atendimento.
+    """
+
+    def __init__(self):
+        self.completed = False
+
+class AdmissionController:
+    """
+    Fila limitada na frente do pipeline do /chat, com slots por departamento.
+    Rejeita com 503 + Retry-After quando a espera estimada passa do limite, em
+    vez de acumular requisições que o cliente já terá abandonado.
+    """
+
+    def __init__(self, slots_per_department: int, max_queue: int, max_wait: float):
+        self.slots_per_department = slots_per_department
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.departments: Dict[str, DepartmentQueue] = {}
+        self.queued = 0
+
+    @asynccontextmanager
+    async def admit(self, department: str, cancelled: threading.Event, deadline: float):
+        queue = self.departments.setdefault(department, DepartmentQueue(self.slots_per_department))
+        expected_wait = queue.estimate_wait()
+        # A espera na fila consome o prazo da própria requisição
+        budget = min(self.max_wait, deadline - time.monotonic())
+        if self.queued >= self.max_queue or expected_wait > budget:
+            logger.warning(f"Requisição rejeitada para {department}: espera estimada de {expected_wait:.1f}s, limite de {budget:.1f}s")
+            raise self._overloaded(expected_wait)
+
+        self.queued += 1
+        queue.waiting += 1
+        try:
+            await self._acquire(queue, cancelled, deadline)
+        finally:
+            self.queued -= 1
+            queue.waiting -= 1
+
+        queue.in_flight += 1
+        ticket = AdmissionTicket()
+        start = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            # Falhas rápidas (ex.: circuit breaker aberto) não podem puxar a média
+            # para baixo justamente quando é preciso rejeitar requisições
+            if ticket.completed:
+                queue.record(time.monotonic() - start)
+            queue.in_flight -= 1
+            queue.semaphore.release()
+
+    @staticmethod
+    def _overloaded(expected_wait: float) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail="Servidor sobrecarregado, tente novamente mais tarde",
+            headers={"Retry-After": str(max(1, math.ceil(expected_wait)))},
+        )
+
+    @classmethod
+    async def _acquire(cls, queue: DepartmentQueue, cancelled: threading.Event, deadline: float) -> None:
+        acquire = asyncio.ensure_future(queue.semaphore.acquire())
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                done, _ = await asyncio.wait({acquire}, timeout=max(0.0, min(0.5, remaining)))
+                if done:
+                    return
+                if cancelled.is_set():
+                    raise ClientDisconnectedError()
+                if remaining <= 0:
+                    # O prazo acabou ainda na fila: não adianta iniciar o pipeline
+                    logger.warning("Prazo da requisição esgotado na fila de admissão")
+                    raise cls._overloaded(queue.estimate_wait())
+        except BaseException:
+            # Inclui o cancelamento da própria task (ex.: desligamento do servidor):
+            # um slot já obtido pelo acquire é devolvido
+            if not acquire.cancel() and not acquire.cancelled() and acquire.exception() is None:
+                queue.semaphore.release()
+            raise
+
+admission = AdmissionController(
+    slots_per_department=config.ADMISSION_SLOTS_PER_DEPARTMENT,
+    max_queue=config.ADMISSION_MAX_QUEUE,
+    max_wait=config.ADMISSION_MAX_WAIT,
+)
+
+async def watch_disconnect(request: Request, cancelled: threading.Event) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(0.5)
+    cancelled.set()
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse serializada com orjson, quando disponível.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
 app = FastAPI()
 
 async def get_api_key(api_key_header: str = Security(api_key_header)):
@@ -51,9 +192,19 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
     
 class ChatRequest(BaseModel):
     system: str = Field(..., description="Sistema de mensagem")
-    department: str = Field(..., description="Departamento")
-    typology: str = Field(..., description="Tipologia")
+    department: Optional[str] = Field(None, description="Departamento")
+    typology: Optional[str] = Field(None, description="Tipologia ('*' consulta todas as tipologias do departamento)")
+    chains: Optional[List[str]] = Field(None, description="Chains consultadas em conjunto, ex.: ['CDC/NORMAS', 'RH/*']")
     query: str = Field(..., description="Consulta do usuário")
+    citations: Literal["none", "metadata", "snippet", "full"] = Field(
+        config.CITATION_MODE, description="Conteúdo das citações retornadas em 'tool'"
+    )
+    snippet_chars: int = Field(
+        config.CITATION_SNIPPET_CHARS, gt=0, description="Tamanho do trecho no modo 'snippet'"
+    )
+    timeout: Optional[float] = Field(
+        None, gt=0, description="Prazo da requisição em segundos (limitado a LLM_REQUEST_TIMEOUT)"
+    )
 
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
@@ -64,57 +215,267 @@ async def rate_limit_middleware(request: Request, call_next):
     response = await call_next(request)
     return response
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    logger.info("Inicializando a aplicação")
+class StartupTimer:
+    """
+    Registra a duração de cada fase da inicialização.
+    """
+
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+            logger.info("Fase de inicialização '%s' concluída em %.3fs", name, self.phases[name])
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+def load_chains_config() -> Dict[str, Dict[str, Any]]:
     try:
         with open("api/chains.json", "r") as file:
             departments_chains = json.load(file)
         logger.info("chains.json carregado com sucesso")
     except Exception as e:
-        logger.error(f"Erro ao carregar departments.json: {e}")
+        logger.error(f"Erro ao carregar chains.json: {e}")
         departments_chains = {}
+    return departments_chains
+
+def warm_up(app: FastAPI, departments_chains: Dict[str, Dict[str, Any]], timer: StartupTimer) -> None:
+    """
+    Importa os módulos pesados (langchain, FAISS, clientes Azure), abre o pool
+    de conexões com o LLM e carrega os índices. Executado fora do event loop.
+
+    `app.state.chains` e `app.state.chains_failed` são lidos no event loop
+    enquanto esta função roda, então nunca são alterados no lugar: cada chain
+    carregada gera uma cópia nova, atribuída de uma vez.
+    """
+    try:
+        with timer.phase("import_embedding_processor"):
+            from functions.embedding_processor import EmbeddingProcessor, parse_chain_spec
 
-    embed = EmbeddingProcessor()
-    app.state.embed = embed
+        with timer.phase("embedding_processor"):
+            embed = EmbeddingProcessor()
+        app.state.embed = embed
 
-    app.state.chains = {
-        dept.upper(): {
-            typology.upper(): embed.create_chain(path)
-            for typology, path in typologies.items()
-        }
+        with timer.phase("llm_connection_pool"):
+            embed.warm_up_connections()
+
+        for dept, typologies in departments_chains.items():
+            for typology, spec in typologies.items():
+                key = (dept.upper(), typology.upper())
+                with timer.phase(f"chain {key[0]}/{key[1]}"):
+                    chain = embed.create_chain(*parse_chain_spec(spec))
+                if chain is None:
+                    app.state.chains_failed = app.state.chains_failed | {key}
+                    continue
+                department_chains = {**app.state.chains.get(key[0], {}), key[1]: chain}
+                app.state.chains = {**app.state.chains, key[0]: department_chains}
+        logger.info("Embed e chains inicializados em %.3fs", timer.elapsed())
+    except Exception as e:
+        logger.error(f"Erro no warm-up da aplicação: {e}", exc_info=True)
+        app.state.warmup_error = str(e)
+    finally:
+        app.state.warmup_done = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Inicializando a aplicação")
+    timer = StartupTimer()
+    with timer.phase("chains_json"):
+        departments_chains = load_chains_config()
+
+    app.state.startup_timer = timer
+    app.state.embed = None
+    app.state.chains = {}
+    app.state.chains_expected = {
+        (dept.upper(), typology.upper())
         for dept, typologies in departments_chains.items()
+        for typology in typologies
     }
-    logger.info("Embed e chains inicializados")
+    app.state.chains_failed = set()
+    app.state.warmup_done = False
+    app.state.warmup_error = None
+
+    warmup = asyncio.to_thread(warm_up, app, departments_chains, timer)
+    if config.WARMUP_IN_BACKGROUND:
+        app.state.warmup_task = asyncio.create_task(warmup)
+    else:
+        app.state.warmup_task = None
+        await warmup
+
+    logger.info("Aplicação aceitando conexões após %.3fs", timer.elapsed())
     yield
+    if app.state.warmup_task is not None and not app.state.warmup_task.done():
+        # A thread do warm-up não pode ser interrompida; aguarda para fechar o embed criado por ela
+        logger.info("Aguardando o fim do warm-up para finalizar")
+        await app.state.warmup_task
+    if app.state.embed is not None:
+        app.state.embed.close()
     logger.info("Aplicação finalizada")
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Brotli quando o cliente aceita, com fallback para gzip
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=config.RESPONSE_COMPRESSION_MIN_SIZE)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=config.RESPONSE_COMPRESSION_MIN_SIZE)
+
+def parse_chain_keys(chains: list) -> Set[Tuple[str, str]]:
+    keys = set()
+    for item in chains:
+        dept, _, typology = item.strip().partition("/")
+        if dept and typology:
+            keys.add((dept.upper(), typology.upper()))
+    return keys
+
+def loaded_chain_keys() -> Set[Tuple[str, str]]:
+    return {
+        (dept, typology)
+        for dept, typologies in app.state.chains.items()
+        for typology in typologies
+    }
 
 async def get_chain(department: str, typology: str) -> Any:
     department_chains = app.state.chains.get(department)
-    
+    chain = department_chains.get(typology) if department_chains else None
+    if chain:
+        return chain
+
+    if (department, typology) in app.state.chains_expected and not app.state.warmup_done:
+        logger.warning(f"Chain ainda em carregamento: {department}/{typology}")
+        raise HTTPException(status_code=503, detail="Chain ainda em carregamento")
     if not department_chains:
         logger.error(f"Departamento não encontrado: {department}")
         raise HTTPException(status_code=404, detail="Departamento não encontrado")
-    chain = department_chains.get(typology)
-    if not chain:
-        logger.error(f"Tipologia não encontrada: {typology} no departamento: {department}")
-        raise HTTPException(status_code=404, detail="Tipologia não encontrada")
-    return chain
+    logger.error(f"Tipologia não encontrada: {typology} no departamento: {department}")
+    raise HTTPException(status_code=404, detail="Tipologia não encontrada")
+
+async def get_department_chains(department: str) -> Dict[str, Any]:
+    """
+    Retorna as chains do departamento, com 503 enquanto alguma delas ainda
+    está carregando, para que o '*' não consulte só parte do departamento.
+    """
+    department_chains = app.state.chains.get(department, {})
+    failed = app.state.chains_failed
+    pending = [
+        typology
+        for dept, typology in app.state.chains_expected
+        if dept == department and typology not in department_chains and (dept, typology) not in failed
+    ]
+    if pending and not app.state.warmup_done:
+        logger.warning(f"Chains do departamento ainda em carregamento: {department}")
+        raise HTTPException(status_code=503, detail="Chain ainda em carregamento")
+    if department_chains:
+        return department_chains
+
+    logger.error(f"Departamento não encontrado: {department}")
+    raise HTTPException(status_code=404, detail="Departamento não encontrado")
+
+async def resolve_chains(request: ChatRequest) -> Dict[str, Any]:
+    """
+    Resolve as chains da requisição para um dicionário "DEPARTAMENTO/TIPOLOGIA" -> chain.
+    Aceita '*' como tipologia para consultar todas as chains de um departamento.
+    """
+    if request.chains:
+        selectors = request.chains
+    elif request.department and request.typology:
+        selectors = [f"{request.department}/{request.typology}"]
+    else:
+        raise HTTPException(status_code=422, detail="Informe department e typology, ou chains")
+
+    resolved = {}
+    for selector in selectors:
+        department, _, typology = selector.strip().upper().partition("/")
+        if not department or not typology:
+            raise HTTPException(status_code=422, detail=f"Chain inválida: {selector}")
+        if typology == "*":
+            for name, chain in (await get_department_chains(department)).items():
+                resolved[f"{department}/{name}"] = chain
+        else:
+            resolved[f"{department}/{typology}"] = await get_chain(department, typology)
+    return resolved
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(chains: Optional[str] = None):
+    """
+    Pronto quando as chains selecionadas (parâmetro `chains`, ex.: "CDC/NORMAS,RH/FAQ",
+    ou `config.READINESS_CHAINS`) estão carregadas. Sem seleção, exige o fim do
+    warm-up com todas as chains do chains.json que puderam ser carregadas.
+    """
+    selected = parse_chain_keys(chains.split(",") if chains else config.READINESS_CHAINS)
+    loaded = loaded_chain_keys()
+
+    if selected:
+        pending = selected - loaded
+        ready = not pending
+    else:
+        pending = app.state.chains_expected - loaded - app.state.chains_failed
+        ready = app.state.warmup_done and app.state.warmup_error is None
+
+    content = {
+        "status": "ready" if ready else "starting",
+        "loaded": sorted(f"{d}/{t}" for d, t in loaded),
+        "pending": sorted(f"{d}/{t}" for d, t in pending),
+        "failed": sorted(f"{d}/{t}" for d, t in app.state.chains_failed),
+        "startup_phases": app.state.startup_timer.phases,
+    }
+    if app.state.warmup_error:
+        content["error"] = app.state.warmup_error
+    return JSONResponse(status_code=200 if ready else 503, content=content)
 
 @app.post("/chat")
-async def chat(request: ChatRequest, api_key: str = Depends(get_api_key)):
-    logger.info(f"Requisição recebida para o departamento: {request.department}, tipologia: {request.typology}")
+async def chat(request: ChatRequest, http_request: Request, api_key: str = Depends(get_api_key)):
+    # O prazo conta a partir da chegada, incluindo a espera na fila de admissão
+    timeout = min(request.timeout or config.LLM_REQUEST_TIMEOUT, config.LLM_REQUEST_TIMEOUT)
+    deadline = time.monotonic() + timeout
+    logger.info(f"Requisição recebida para o departamento: {request.department}, tipologia: {request.typology}, chains: {request.chains}")
+    cancelled = threading.Event()
+    watcher = asyncio.create_task(watch_disconnect(http_request, cancelled))
     try:
-        chain = await get_chain(request.department.upper(), request.typology.upper())
-        if not chain:
+        chains = await resolve_chains(request)
+        if not chains:
             logger.error("Chain não disponível")
             raise HTTPException(status_code=500, detail="Chain não disponível")
-        
-        response = await asyncio.to_thread(app.state.embed.get_response, request.query, chain)
+
+        # Fan-out entre departamentos diferentes usa uma fila própria
+        departments = {name.partition("/")[0] for name in chains}
+        department = departments.pop() if len(departments) == 1 else "*"
+
+        async with admission.admit(department, cancelled, deadline) as ticket:
+            try:
+                if len(chains) == 1:
+                    chain = next(iter(chains.values()))
+                    response = await asyncio.to_thread(
+                        app.state.embed.get_response, request.query, chain, request.citations, request.snippet_chars, deadline, cancelled, True
+                    )
+                else:
+                    logger.info(f"Consulta em fan-out nas chains: {', '.join(chains)}")
+                    response = await asyncio.to_thread(
+                        app.state.embed.get_fanout_response, request.query, chains, request.citations, request.snippet_chars, deadline, cancelled, True
+                    )
+            except Exception as e:
+                logger.error(f"Erro ao obter resposta: {e}")
+                response = app.state.embed.error_response(request.query)
+            else:
+                ticket.completed = True
+        if cancelled.is_set():
+            raise ClientDisconnectedError()
         logger.info("Resposta gerada com sucesso")
-        return JSONResponse(content=response)
+        return FastJSONResponse(content=response)
+    except ClientDisconnectedError:
+        logger.warning("Cliente desconectado, processamento cancelado")
+        return Response(status_code=499)
     except HTTPException as e:
         logger.error(f"HTTPException: {e.detail}")
         raise e
@@ -124,7 +485,9 @@ async def chat(request: ChatRequest, api_key: str = Depends(get_api_key)):
             status_code=500,
             content={"error": f"Ocorreu um erro: {str(e)}"}
         )
-    
+    finally:
+        watcher.cancel()
+
 @app.exception_handler(404)
 async def custom_404_handler(request: Request, exc: HTTPException):
     logger.warning(f"404 Não Encontrado: {request.url}")
@@ -0,0 +1,68 @@
+# benchmarks/embeddings_throughput.py
+#
+# Mede embeddings/s do backend local (config.LOCAL_EMBEDDING_*) na ingestão,
+# com e sem length bucketing, e nas consultas, com e sem dynamic batching.
+# O SentenceTransformer.encode já ordena a entrada por tamanho; o baseline sem
+# bucketing são lotes de `batch_size` textos na ordem original.
+# Com BENCH_AZURE=1 mede também o AzureOpenAIEmbeddings.
+#
+# Uso: python -m benchmarks.embeddings_throughput
+
+import os
+import random
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from functions.embedding_backends import LocalEmbeddings, create_embedding_backend
+
+DOCUMENTS = int(os.getenv("BENCH_DOCUMENTS", 512))
+QUERIES = int(os.getenv("BENCH_QUERIES", 256))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", 16))
+
+
+def make_texts(count: int, min_words: int, max_words: int) -> list:
+    random.seed(0)
+    words = ["".join(random.choices(string.ascii_lowercase, k=random.randint(2, 10))) for _ in range(2000)]
+    return [" ".join(random.choices(words, k=random.randint(min_words, max_words))) for _ in range(count)]
+
+
+def report(label: str, count: int, elapsed: float) -> None:
+    print(f"{label:<45}{count / elapsed:>10.1f} embeddings/s")
+
+
+if __name__ == "__main__":
+    documents = make_texts(DOCUMENTS, 20, 400)
+    queries = make_texts(QUERIES, 5, 20)
+
+    local = LocalEmbeddings()
+    local.embed_documents(documents[:32])  # aquecimento
+
+    start = time.perf_counter()
+    for i in range(0, DOCUMENTS, local.batch_size):
+        local._encode(documents[i : i + local.batch_size])
+    report("local, ingestão, lotes na ordem original", DOCUMENTS, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    local.model.encode(documents, batch_size=local.batch_size)
+    report("local, ingestão, encode direto", DOCUMENTS, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    local.embed_documents(documents)
+    report("local, ingestão, bucketing + threads", DOCUMENTS, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for query in queries:
+        local._encode([query])
+    report("local, consultas sequenciais", QUERIES, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        list(executor.map(local.embed_query, queries))
+    report(f"local, consultas concorrentes ({CONCURRENCY}), lotes", QUERIES, time.perf_counter() - start)
+
+    if os.getenv("BENCH_AZURE"):
+        azure = create_embedding_backend("azure")
+        start = time.perf_counter()
+        azure.embed_documents(documents)
+        report("azure, ingestão", DOCUMENTS, time.perf_counter() - start)
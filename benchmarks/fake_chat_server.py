@@ -0,0 +1,55 @@
+# benchmarks/fake_chat_server.py
+#
+# Servidor local que imita o endpoint de chat completions do Azure OpenAI,
+# injetando latência e erros, para verificar o ResilientChatClient.
+#
+# Uso: uvicorn benchmarks.fake_chat_server:app --port 8001
+#
+# Variáveis de ambiente:
+#   FAKE_LLM_LATENCY     latência típica em segundos (padrão 0.2)
+#   FAKE_LLM_SLOW_RATE   fração das requisições com latência de cauda (padrão 0.02)
+#   FAKE_LLM_SLOW_LATENCY latência de cauda em segundos (padrão 5)
+#   FAKE_LLM_ERROR_RATE  fração das requisições que respondem 429/500/503 (padrão 0.05)
+
+import asyncio
+import os
+import random
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+LATENCY = float(os.getenv("FAKE_LLM_LATENCY", 0.2))
+SLOW_RATE = float(os.getenv("FAKE_LLM_SLOW_RATE", 0.02))
+SLOW_LATENCY = float(os.getenv("FAKE_LLM_SLOW_LATENCY", 5))
+ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", 0.05))
+
+app = FastAPI()
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def chat_completions(deployment: str):
+    slow = random.random() < SLOW_RATE
+    await asyncio.sleep(SLOW_LATENCY if slow else random.uniform(0.5, 1.5) * LATENCY)
+
+    if random.random() < ERROR_RATE:
+        status_code = random.choice([429, 500, 503])
+        return JSONResponse(
+            status_code=status_code,
+            content={"error": {"code": str(status_code), "message": "Erro injetado"}},
+        )
+
+    return {
+        "id": f"fake-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": deployment,
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": f"Resposta de {deployment}"},
+            }
+        ],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    }
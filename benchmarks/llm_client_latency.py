@@ -0,0 +1,71 @@
+# benchmarks/llm_client_latency.py
+#
+# Compara a latência de cauda e a taxa de erro do AzureChatOpenAI puro com a do
+# ResilientChatClient (retries, hedging e circuit breaker), usando o servidor
+# falso de benchmarks/fake_chat_server.py.
+#
+# Uso:
+#   uvicorn benchmarks.fake_chat_server:app --port 8001
+#   python -m benchmarks.llm_client_latency
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from functions.llm_client import (
+    ResilientChatClient,
+    build_azure_chat,
+    create_async_http_client,
+    create_http_client,
+    deadline_scope,
+)
+
+ENDPOINT = os.getenv("FAKE_LLM_ENDPOINT", "http://127.0.0.1:8001/")
+REQUESTS = int(os.getenv("BENCH_REQUESTS", 300))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", 10))
+DEADLINE = float(os.getenv("BENCH_DEADLINE", 10))
+
+
+def run(llm) -> None:
+    def call(_):
+        start = time.monotonic()
+        try:
+            with deadline_scope(start + DEADLINE):
+                llm.invoke("pergunta")
+            return time.monotonic() - start, None
+        except Exception as e:
+            return time.monotonic() - start, type(e).__name__
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        results = list(executor.map(call, range(REQUESTS)))
+
+    latencies = sorted(latency for latency, error in results if error is None)
+    errors = [error for _, error in results if error is not None]
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] if latencies else float("nan")
+
+    print(
+        f"  ok={len(latencies)} erros={len(errors)} "
+        f"p50={percentile(50):.3f}s p95={percentile(95):.3f}s p99={percentile(99):.3f}s"
+    )
+    if errors:
+        print(f"  tipos de erro: {sorted(set(errors))}")
+
+
+if __name__ == "__main__":
+    http_client = create_http_client()
+
+    print("AzureChatOpenAI sem retries:")
+    run(build_azure_chat("primary", ENDPOINT, http_client))
+
+    print("ResilientChatClient (primário + secundário):")
+    http_async_client = create_async_http_client()
+    client = ResilientChatClient(
+        build_azure_chat("primary", ENDPOINT, http_async_client=http_async_client),
+        build_azure_chat("secondary", ENDPOINT, http_async_client=http_async_client),
+    )
+    run(client)
+    client.run(http_async_client.aclose())
+    client.close()
+    http_client.close()
@@ -0,0 +1,74 @@
+# benchmarks/response_serialization.py
+#
+# Mede o tamanho do payload e o tempo de serialização da resposta do /chat
+# para cada modo de citação, com json (stdlib) e orjson, e o tamanho após
+# compressão gzip/brotli.
+#
+# Uso: python -m benchmarks.response_serialization
+
+import gzip
+import json
+import random
+import string
+import time
+
+from langchain.schema import Document
+
+from functions.embedding_processor import EmbeddingProcessor
+import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+N_DOCUMENTS = 20
+ITERATIONS = 200
+
+
+def make_documents() -> list:
+    random.seed(0)
+    words = ["".join(random.choices(string.ascii_lowercase, k=random.randint(2, 10))) for _ in range(2000)]
+    documents = []
+    for i in range(N_DOCUMENTS):
+        text = " ".join(random.choices(words, k=900))[: config.MAX_CHUNK_SIZE]
+        documents.append(
+            Document(
+                page_content=f"Documento: manual_{i} | Número da página: {i + 1} | Texto do chunk: {text}",
+                # Mesmas chaves geradas pela ingestão de PDFs (DocumentProcessor)
+                metadata={"file_path": f"manual_{i}", "page_number": i + 1, "links": [], "page": i + 1, "total_pages": 1},
+            )
+        )
+    return documents
+
+
+def stdlib_dumps(content) -> bytes:
+    # Mesmos parâmetros usados pelo JSONResponse do Starlette
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def timeit(function, content) -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        function(content)
+    return (time.perf_counter() - start) / ITERATIONS * 1000
+
+
+if __name__ == "__main__":
+    documents = make_documents()
+    answer = "Resposta de exemplo. " * 100
+
+    print(f"{'modo':<10}{'bytes':>10}{'gzip':>10}{'brotli':>10}{'json ms':>10}{'orjson ms':>11}")
+    for mode in ("full", "snippet", "metadata", "none"):
+        content = EmbeddingProcessor._build_response("pergunta", answer, documents, mode)
+        payload = stdlib_dumps(content)
+        gzip_size = len(gzip.compress(payload))
+        brotli_size = len(brotli.compress(payload, quality=4)) if brotli else "-"
+        json_ms = timeit(stdlib_dumps, content)
+        orjson_ms = f"{timeit(orjson.dumps, content):.3f}" if orjson else "-"
+        print(f"{mode:<10}{len(payload):>10}{gzip_size:>10}{brotli_size:>10}{json_ms:>10.3f}{orjson_ms:>11}")
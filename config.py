@@ -1,14 +1,23 @@
 import warnings
-from platform import python_version
 #pip freeze | ForEach-Object {pip uninstall -y $_}
 
 warnings.filterwarnings("ignore")
-print(f'Este projeto foi desenvolvido na versão do Python 3.12.1, sua versão atual do Python é a {python_version()}')
+PYTHON_VERSION = '3.12.1'  # Versão do Python em que o projeto foi desenvolvido
 
 # Configurações do Hugging Face
 EMBEDDING_MODEL = 'all-MiniLM-L6-v2'  #https://huggingface.co/sentence-transformers/all-MiniLM-L6-v2
 DEVICE = 'cpu'
 
+# Backend de embeddings padrão: 'azure' (AzureOpenAIEmbeddings) ou 'local' (modelo acima, na CPU).
+# Pode ser definido por chain no api/chains.json: {"path": "CDC/NORMAS", "embedding": "local"}
+EMBEDDING_BACKEND = 'azure'
+LOCAL_EMBEDDING_MODEL_PATH = 'files/models/all-MiniLM-L6-v2'
+LOCAL_EMBEDDING_RUNTIME = 'torch'    # 'torch' ou 'onnx'
+LOCAL_EMBEDDING_ONNX_FILE = None     # Ex.: 'onnx/model_qint8_avx2.onnx' para o modelo int8
+LOCAL_EMBEDDING_BATCH_SIZE = 32
+LOCAL_EMBEDDING_WORKERS = 2
+LOCAL_EMBEDDING_MAX_WAIT = 0.005     # segundos que uma consulta aguarda para formar um lote
+
 # Configurações da OpenAI
 OPENAI_API_KEY= 'sk-NfT5757MmbfsF.......'
 OPENAI_LLM_MODEL = 'gpt-4o'
@@ -22,6 +31,8 @@ AZURE_OPENAI_MODEL = "gpt-4o-mini"
 AZURE_OPENAI_MODEL_NAME = AZURE_OPENAI_MODEL
 AZURE_OPENAI_MAX_TOKENS = 10000
 AZURE_GPT_TEMPERATURE = 0.7
+AZURE_OPENAI_SECONDARY_MODEL = None     # Deployment secundário para hedging (opcional)
+AZURE_OPENAI_SECONDARY_ENDPOINT = None  # Vazio = mesmo endpoint do deployment principal
 AZURE_EMBEDDINGS_DEPLOYMENT_NAME = "ada-embedding"
 AZURE_EMBEDDING_MODEL_NAME = "text-embedding-ada-002"
 
@@ -37,6 +48,52 @@ CHUNK_OVERLAP = 800        # 200 tokens
 PATH_FILE = 'files/docs'
 PATH_VECTOR_STORE = 'files/vectorstore'
 
+# Extração de PDFs
+PATH_PDF_CACHE = 'files/cache/pdf'  # Cache do texto extraído dos PDFs (None desativa)
+PDF_PAGE_TIMEOUT = 30               # Tempo máximo (segundos) para extrair uma página
+PDF_FILE_TIMEOUT = 300              # Tempo máximo (segundos) para extrair um arquivo
+
+# Configurações de inicialização do servidor
+WARMUP_IN_BACKGROUND = True  # Carrega os índices em segundo plano, sem bloquear a porta
+READINESS_CHAINS = []        # Ex.: ["CDC/NORMAS"]; vazio = todas as chains do chains.json
+
+# Pool de conexões HTTP com o backend do LLM
+LLM_HTTP_MAX_CONNECTIONS = 20
+LLM_HTTP_MAX_KEEPALIVE = 10
+LLM_HTTP_KEEPALIVE_EXPIRY = 60  # segundos
+LLM_CONNECT_TIMEOUT = 5         # segundos
+
+# Resiliência das chamadas ao LLM
+LLM_REQUEST_TIMEOUT = 60           # Prazo máximo de uma requisição ao /chat (segundos)
+LLM_MAX_RETRIES = 2                # Novas tentativas em erros transitórios (timeout, 429, 5xx)
+LLM_RETRY_BASE_DELAY = 0.5         # segundos, backoff exponencial com jitter
+LLM_RETRY_MAX_DELAY = 4            # segundos
+LLM_HEDGE_ENABLED = True           # Dispara uma segunda chamada quando a primeira passa do p95
+LLM_HEDGE_PERCENTILE = 95
+LLM_HEDGE_MIN_SAMPLES = 20         # Amostras necessárias antes de usar o percentil medido
+LLM_HEDGE_DEFAULT_DELAY = 15       # segundos, usado até haver amostras suficientes
+LLM_BREAKER_FAILURE_THRESHOLD = 5  # Falhas seguidas que abrem o circuit breaker
+LLM_BREAKER_RESET_TIMEOUT = 30     # segundos até liberar novas tentativas
+
+# Controle de admissão do /chat
+ADMISSION_SLOTS_PER_DEPARTMENT = 4  # Requisições processadas em paralelo por departamento
+ADMISSION_MAX_QUEUE = 64            # Requisições aguardando em fila (todos os departamentos)
+ADMISSION_MAX_WAIT = 10             # Espera estimada (segundos) acima da qual a requisição recebe 503
+ADMISSION_INITIAL_SERVICE_TIME = 5  # Tempo de atendimento (segundos) assumido antes das primeiras medições
+
+# Busca nos índices (MMR), usada tanto em uma chain quanto no fan-out
+RETRIEVER_K = 20             # Documentos enviados ao LLM
+RETRIEVER_LAMBDA_MULT = 0.5  # 1 = só relevância, 0 = só diversidade
+
+# Consulta em múltiplas chains (fan-out)
+FANOUT_K_PER_CHAIN = 20  # Candidatos buscados em cada chain antes do MMR
+FANOUT_MAX_WORKERS = 8
+
+# Serialização das respostas
+CITATION_MODE = 'full'          # none | metadata | snippet | full
+CITATION_SNIPPET_CHARS = 300    # Tamanho do trecho no modo 'snippet'
+RESPONSE_COMPRESSION_MIN_SIZE = 1000  # Respostas menores que isso (bytes) não são comprimidas
+
 DEBUG = True
 LANGCHAIN_DEBUG = True
 VERBOSE = True
@@ -1,12 +1,17 @@
 # functions/document_processor.py
 
+import hashlib
+import json
 import logging
+import multiprocessing
+from multiprocessing.connection import Connection
 import os
 import re
+import time
 import unicodedata
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from PyPDF2 import PdfReader
 import requests
@@ -23,8 +28,17 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 import config
 
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
 logger = logging.getLogger(__name__)
 
+# Incrementar quando a extração mudar, para invalidar o cache de PDFs
+PDF_EXTRACTOR_VERSION = 1
+PDF_EXTRACTOR = "pymupdf" if pymupdf is not None else "pypdf2"
+
 
 class DocumentProcessor:
     """
@@ -37,10 +51,15 @@ class DocumentProcessor:
         min_chunk_size: int = config.MIN_CHUNK_SIZE,
         max_chunk_size: int = config.MAX_CHUNK_SIZE,
         chunk_overlap: int = config.CHUNK_OVERLAP,
+        pdf_cache_path: Optional[str] = config.PATH_PDF_CACHE,
     ) -> None:
         self.min_chunk_size = min_chunk_size
         self.max_chunk_size = max_chunk_size
         self.chunk_overlap = chunk_overlap
+        self.pdf_cache_path = pdf_cache_path
+        self._pdf_process: Optional[multiprocessing.Process] = None
+        self._pdf_tasks: Optional[multiprocessing.Queue] = None
+        self._pdf_results: Optional[Connection] = None
 
     def _get_file_name(self, path: str) -> str:
         return Path(path).stem
@@ -221,43 +240,232 @@ class DocumentProcessor:
 
         return documents
 
+    @staticmethod
+    def _iter_pdf_pages_pymupdf(
+        file_path: str, start_page: int
+    ) -> Iterator[Tuple[int, int, str, List[str]]]:
+        """
+        Extrai texto e links de cada página com PyMuPDF.
+        """
+        with pymupdf.open(file_path) as doc:
+            for page_num in range(start_page, doc.page_count):
+                page = doc[page_num]
+                links = [
+                    link["uri"]
+                    for link in page.get_links()
+                    if link.get("kind") == pymupdf.LINK_URI and link.get("uri")
+                ]
+                yield doc.page_count, page_num, page.get_text(), links
+
+    @staticmethod
+    def _iter_pdf_pages_pypdf2(
+        file_path: str, start_page: int
+    ) -> Iterator[Tuple[int, int, str, List[str]]]:
+        """
+        Extrai texto e links (anotações /URI) de cada página com PyPDF2.
+        """
+        doc = PdfReader(file_path)
+        total_pages = len(doc.pages)
+        for page_num in range(start_page, total_pages):
+            page = doc.pages[page_num]
+            text = page.extract_text()
+
+            if not isinstance(text, str):
+                logger.warning(f"Texto vazio ou não processável na página {page_num} do arquivo: {file_path}")
+                text = ""
+
+            links = []
+            for annot in page.get("/Annots") or []:
+                action = annot.get_object().get("/A")
+                uri = action.get("/URI") if action else None
+                if uri is None:
+                    continue
+                if isinstance(uri, str):
+                    links.append(uri)
+                else:
+                    logger.warning(f"Link inesperado na página {page_num+1} do arquivo: {file_path}, link: {uri}")
+
+            yield total_pages, page_num, text, links
+
+    @classmethod
+    def _iter_pdf_pages(
+        cls, file_path: str, start_page: int
+    ) -> Iterator[Tuple[int, int, str, List[str]]]:
+        """
+        Usa o PyMuPDF quando disponível, com o PyPDF2 como alternativa.
+        """
+        if pymupdf is not None:
+            try:
+                for page in cls._iter_pdf_pages_pymupdf(file_path, start_page):
+                    yield page
+                    start_page = page[1] + 1
+                return
+            except Exception as e:
+                logger.warning(f"PyMuPDF falhou no arquivo {file_path}, usando PyPDF2: {e}")
+        yield from cls._iter_pdf_pages_pypdf2(file_path, start_page)
+
+    @staticmethod
+    def _pdf_worker(tasks: multiprocessing.Queue, results: Connection) -> None:
+        """
+        Processo extrator: recebe (arquivo, página inicial) e envia as páginas
+        extraídas, seguidas de "done" ou "error".
+        """
+        results.send(("ready", None))
+        for file_path, start_page in iter(tasks.get, None):
+            try:
+                for page in DocumentProcessor._iter_pdf_pages(file_path, start_page):
+                    results.send(("page", page))
+            except Exception as e:
+                results.send(("error", str(e)))
+                continue
+            results.send(("done", None))
+
+    def _start_pdf_worker(self) -> None:
+        # Pipe em vez de Queue: o send é síncrono, então as páginas enviadas
+        # antes de uma queda do processo não se perdem
+        self._pdf_tasks = multiprocessing.Queue()
+        self._pdf_results, sender = multiprocessing.Pipe(duplex=False)
+        self._pdf_process = multiprocessing.Process(
+            target=DocumentProcessor._pdf_worker,
+            args=(self._pdf_tasks, sender),
+            name="pdf-extractor",
+            daemon=True,
+        )
+        self._pdf_process.start()
+        sender.close()
+        # A inicialização do processo (imports, no modo spawn) não conta no
+        # tempo limite das páginas
+        self._pdf_results.recv()
+
+    def close_pdf_worker(self, kill: bool = False) -> None:
+        """
+        Encerra o processo extrator de PDFs. Com `kill`, o processo é terminado
+        mesmo no meio de uma página.
+        """
+        if self._pdf_process is None:
+            return
+        if kill:
+            self._pdf_process.terminate()
+        else:
+            self._pdf_tasks.put(None)
+        self._pdf_process.join(timeout=5)
+        if self._pdf_process.is_alive():
+            self._pdf_process.kill()
+            self._pdf_process.join()
+        self._pdf_tasks.close()
+        self._pdf_results.close()
+        self._pdf_process = self._pdf_tasks = self._pdf_results = None
+
+    def _next_pdf_result(self, timeout: float) -> Tuple[str, Any]:
+        """
+        Espera o próximo resultado do extrator por até `timeout` segundos.
+        Retorna ("timeout", None) se o tempo acabar e ("crashed", código de
+        saída) se o processo terminar sem responder.
+        """
+        try:
+            if self._pdf_results.poll(max(0.0, timeout)):
+                return self._pdf_results.recv()
+        except EOFError:
+            self._pdf_process.join(timeout=5)
+            return "crashed", self._pdf_process.exitcode
+        return "timeout", None
+
+    def _extract_pdf_pages(self, file_path: str) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Extrai as páginas do PDF respeitando PDF_PAGE_TIMEOUT e PDF_FILE_TIMEOUT.
+
+        A extração roda em um processo separado, reaproveitado entre arquivos.
+        Se uma página estourar o tempo (ou derrubar o processo), o processo é
+        terminado, a página é descartada e a extração recomeça na página
+        seguinte com um novo processo. Retorna as páginas extraídas e se a
+        extração foi completa.
+        """
+        deadline = time.monotonic() + config.PDF_FILE_TIMEOUT
+        pages: List[Dict[str, Any]] = []
+        next_page = 0
+        total_pages: Optional[int] = None
+        complete = True
+
+        while total_pages is None or next_page < total_pages:
+            if self._pdf_process is None:
+                self._start_pdf_worker()
+            self._pdf_tasks.put((file_path, next_page))
+
+            while True:
+                timeout = min(config.PDF_PAGE_TIMEOUT, deadline - time.monotonic())
+                kind, payload = self._next_pdf_result(timeout)
+
+                if kind in ("timeout", "crashed"):
+                    # Termina o processo para a página travada não continuar consumindo CPU
+                    self.close_pdf_worker(kill=True)
+                    complete = False
+                    if time.monotonic() >= deadline:
+                        logger.warning(f"Tempo limite do arquivo excedido, páginas restantes ignoradas: {file_path}")
+                        return pages, complete
+                    if total_pages is None:
+                        # Nem a abertura do arquivo terminou; não há como seguir para a próxima página
+                        logger.error(f"Falha ao abrir o arquivo (tempo limite ou queda do extrator): {file_path}")
+                        return pages, complete
+                    if kind == "crashed":
+                        logger.warning(f"Extrator encerrado (código {payload}) na página {next_page + 1} do arquivo: {file_path}")
+                    else:
+                        logger.warning(f"Tempo limite excedido na página {next_page + 1} do arquivo: {file_path}")
+                    next_page += 1
+                    break
+
+                if kind == "page":
+                    total_pages, page_num, text, links = payload
+                    pages.append({"page_number": page_num + 1, "text": text, "links": links})
+                    next_page = page_num + 1
+                elif kind == "error":
+                    logger.error(f"Erro ao processar o arquivo {file_path}: {payload}")
+                    return pages, False
+                else:
+                    return pages, complete
+
+        return pages, complete
+
+    def _pdf_cache_file(self, file_path: str) -> str:
+        """
+        Caminho no cache para o PDF, a partir do hash do conteúdo e da versão do extrator.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(block)
+        key = f"{digest.hexdigest()}-{PDF_EXTRACTOR}-v{PDF_EXTRACTOR_VERSION}"
+        return os.path.join(self.pdf_cache_path, f"{key}.json")
+
     def extract_from_pdf(self, file_path: str) -> List[Document]:
         """
         Extrai texto e metadados de um arquivo PDF.
+
+        O texto bruto e os links de cada página ficam em cache (PATH_PDF_CACHE),
+        então mudanças na normalização ou no chunking não exigem reprocessar o PDF.
         """
+        cache_file = self._pdf_cache_file(file_path) if self.pdf_cache_path else None
+
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, "r", encoding="utf-8") as file:
+                pages = json.load(file)
+            logger.info(f"Páginas carregadas do cache: {file_path}")
+        else:
+            pages, complete = self._extract_pdf_pages(file_path)
+            # Extrações incompletas (timeout ou erro) não vão para o cache
+            if cache_file and complete:
+                os.makedirs(self.pdf_cache_path, exist_ok=True)
+                tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+                with open(tmp_file, "w", encoding="utf-8") as file:
+                    json.dump(pages, file, ensure_ascii=False)
+                os.replace(tmp_file, cache_file)
+
         documents = []
-        try:
-            doc = PdfReader(file_path)  # Carrega o PDF
-
-            # Iterar sobre as páginas do documento
-            for page_num, page in enumerate(doc.pages):
-                text = page.extract_text()  # Extrai o texto da página
-
-                if not isinstance(text, str):
-                    logger.warning(f"Texto vazio ou não processável na página {page_num} do arquivo: {file_path}")
-                    text = ""
-
-                # Extraindo links (anotações)
-                links = []
-                if "/Annots" in page:
-                    for annot in page["/Annots"]:
-                        annot_obj = annot.get_object()
-                        if "/A" in annot_obj and "/URI" in annot_obj["/A"]:
-                            uri = annot_obj["/A"]["/URI"]
-                            if isinstance(uri, str):
-                                links.append(uri)
-                            else:
-                                logger.warning(f"Link inesperado na página {page_num+1} do arquivo: {file_path}, link: {uri}")
-
-                metadata: Dict[str, Any] = {
-                    "file_path": file_path,
-                    "page_number": page_num + 1,
-                    "links": links,
-                }
-
-                documents.append(Document(page_content=text, metadata=metadata))
-
-        except Exception as e:
-            logger.error(f"Erro ao processar o arquivo {file_path}: {e}")
-        
-        return documents
\ No newline at end of file
+        for page in pages:
+            metadata: Dict[str, Any] = {
+                "file_path": file_path,
+                "page_number": page["page_number"],
+                "links": page["links"],
+            }
+            documents.append(Document(page_content=page["text"], metadata=metadata))
+
+        return documents
@@ -0,0 +1,157 @@
+# functions/embedding_backends.py
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_openai import AzureOpenAIEmbeddings
+
+import config
+
+logger = logging.getLogger(__name__)
+
+class LocalEmbeddings(Embeddings):
+    """
+    Embeddings gerados localmente na CPU com sentence-transformers.
+
+    Na ingestão, os textos são agrupados por tamanho (length bucketing) para
+    reduzir o padding e os lotes são processados em um pool de threads. Nas
+    consultas, chamadas concorrentes de `embed_query` são reunidas em um único
+    lote (dynamic batching).
+    """
+
+    def __init__(
+        self,
+        model_path: str = config.LOCAL_EMBEDDING_MODEL_PATH,
+        device: str = config.DEVICE,
+        runtime: str = config.LOCAL_EMBEDDING_RUNTIME,
+        onnx_file: Optional[str] = config.LOCAL_EMBEDDING_ONNX_FILE,
+        batch_size: int = config.LOCAL_EMBEDDING_BATCH_SIZE,
+        workers: int = config.LOCAL_EMBEDDING_WORKERS,
+        max_wait: float = config.LOCAL_EMBEDDING_MAX_WAIT,
+    ) -> None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "O backend de embeddings 'local' requer o pacote sentence-transformers"
+            ) from e
+
+        model_kwargs = {"device": device}
+        if runtime == "onnx":
+            # Requer sentence-transformers[onnx]; o arquivo pode ser uma versão int8
+            model_kwargs["backend"] = "onnx"
+            if onnx_file:
+                model_kwargs["model_kwargs"] = {"file_name": onnx_file}
+
+        self.model = SentenceTransformer(model_path, **model_kwargs)
+        # Nome do modelo carregado (último componente do caminho ou id do Hub);
+        # o arquivo ONNX entra no nome porque a versão int8 gera vetores diferentes
+        self.model_name = os.path.basename(os.path.normpath(model_path))
+        if runtime == "onnx" and onnx_file:
+            self.model_name += f":{onnx_file}"
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="embeddings"
+        )
+
+        self._queries: queue.Queue = queue.Queue()
+        self._batcher = threading.Thread(
+            target=self._batch_queries, name="embeddings-batcher", daemon=True
+        )
+        self._batcher.start()
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(
+            texts,
+            batch_size=len(texts),
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        ).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera os embeddings em lotes de textos com tamanho parecido,
+        preservando a ordem original.
+        """
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [
+            order[i : i + self.batch_size]
+            for i in range(0, len(order), self.batch_size)
+        ]
+
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        results = self.executor.map(
+            lambda batch: self._encode([texts[i] for i in batch]), batches
+        )
+        for batch, batch_vectors in zip(batches, results):
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        future: Future = Future()
+        self._queries.put((text, future))
+        return future.result()
+
+    def _batch_queries(self) -> None:
+        """
+        Reúne as consultas que chegam em até `max_wait` segundos (ou até
+        `batch_size` consultas) e gera os embeddings de uma só vez.
+        """
+        while True:
+            items = [self._queries.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queries.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = self._encode([text for text, _ in items])
+            except Exception as e:
+                logger.error("Erro ao gerar embeddings locais: %s", e)
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(items, vectors):
+                future.set_result(vector)
+
+
+def embedding_model_name(embeddings: Embeddings) -> str:
+    """
+    Nome do modelo que de fato gera os vetores do backend.
+    """
+    if isinstance(embeddings, LocalEmbeddings):
+        return embeddings.model_name
+    return embeddings.model
+
+
+def create_embedding_backend(name: str) -> Embeddings:
+    """
+    Cria o backend de embeddings pelo nome ('azure' ou 'local').
+    """
+    if name == "azure":
+        return AzureOpenAIEmbeddings(
+            azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
+            api_key=config.AZURE_OPENAI_API_KEY,
+            azure_deployment=config.AZURE_EMBEDDINGS_DEPLOYMENT_NAME,
+            model=config.AZURE_EMBEDDING_MODEL_NAME,
+            chunk_size=config.EMBED_CHUNK_SIZE
+        )
+    if name == "local":
+        return LocalEmbeddings()
+    raise ValueError(f"Backend de embeddings desconhecido: {name}")
@@ -1,18 +1,43 @@
+import json
 import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from langchain.schema import Document
 from langchain_community.vectorstores import FAISS
-from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.embeddings import Embeddings
 
+from functions.embedding_backends import (
+    create_embedding_backend,
+    embedding_model_name,
+)
+from functions.llm_client import (
+    ResilientChatClient,
+    build_azure_chat,
+    create_async_http_client,
+    deadline_scope,
+)
 import config
 
 logger = logging.getLogger(__name__)
 
+def parse_chain_spec(spec: Any) -> Tuple[str, Optional[str]]:
+    """
+    Lê uma entrada do chains.json: o caminho do índice ("CDC/NORMAS") ou um
+    objeto {"path": "CDC/NORMAS", "embedding": "local"}.
+    """
+    if isinstance(spec, str):
+        return spec, None
+    return spec["path"], spec.get("embedding")
+
 class EmbeddingProcessor:
     """
     Classe para processar embeddings e interagir com os serviços Azure OpenAI.
@@ -26,8 +51,10 @@ class EmbeddingProcessor:
 
         self.vector_store_path = vector_store_path
         self.prompt_template = self._create_prompt_template()
+        self.http_client = create_async_http_client()
         self.llm_api = self._initialize_azure_chat()
-        self.embed_model = self._initialize_azure_embeddings()
+        self.embed_models: Dict[str, Embeddings] = {}
+        self.embed_model = self.get_embedding_model(config.EMBEDDING_BACKEND)
 
     @staticmethod
     def _create_prompt_template() -> PromptTemplate:
@@ -58,58 +85,151 @@ class EmbeddingProcessor:
 
         return combined_prompt
 
-    def _initialize_azure_chat(self) -> AzureChatOpenAI:
+    def warm_up_connections(self) -> None:
         """
-        Inicializa a API AzureChatOpenAI.
+        Abre antecipadamente uma conexão (TCP/TLS) com o endpoint do LLM,
+        para que a primeira requisição não pague o handshake.
         """
-        return AzureChatOpenAI(
-            api_key=config.AZURE_OPENAI_API_KEY,
-            api_version=config.AZURE_OPENAI_API_VERSION,
-            azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
-            azure_deployment=config.AZURE_OPENAI_MODEL,
-            temperature=config.AZURE_GPT_TEMPERATURE
-        )
+        try:
+            self.llm_api.run(
+                self.http_client.head(config.AZURE_OPENAI_ENDPOINT, timeout=5)
+            )
+        except Exception as e:
+            logger.warning("Falha ao pré-abrir conexão com o LLM: %s", e)
 
-    def _initialize_azure_embeddings(self) -> AzureOpenAIEmbeddings:
+    def close(self) -> None:
         """
-        Inicializa o modelo de embeddings do Azure.
+        Fecha o cliente do LLM e o pool de conexões HTTP.
         """
+        self.llm_api.run(self.http_client.aclose())
+        self.llm_api.close()
 
-        return AzureOpenAIEmbeddings(
-            azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
-            api_key=config.AZURE_OPENAI_API_KEY,
-            azure_deployment=config.AZURE_EMBEDDINGS_DEPLOYMENT_NAME,
-            model=config.AZURE_EMBEDDING_MODEL_NAME,
-            chunk_size=config.EMBED_CHUNK_SIZE
+    def _initialize_azure_chat(self) -> ResilientChatClient:
+        """
+        Inicializa o cliente do LLM (AzureChatOpenAI com hedging, retries e
+        circuit breaker).
+        """
+        primary = build_azure_chat(
+            config.AZURE_OPENAI_MODEL,
+            config.AZURE_OPENAI_ENDPOINT,
+            http_async_client=self.http_client,
         )
+        secondary = None
+        if config.AZURE_OPENAI_SECONDARY_MODEL:
+            secondary = build_azure_chat(
+                config.AZURE_OPENAI_SECONDARY_MODEL,
+                config.AZURE_OPENAI_SECONDARY_ENDPOINT or config.AZURE_OPENAI_ENDPOINT,
+                http_async_client=self.http_client,
+            )
+        return ResilientChatClient(primary, secondary)
+
+    def get_embedding_model(self, backend: str) -> Embeddings:
+        """
+        Retorna o backend de embeddings pelo nome, criando-o no primeiro uso.
+        """
+        if backend not in self.embed_models:
+            self.embed_models[backend] = create_embedding_backend(backend)
+        return self.embed_models[backend]
+
+    def _write_index_metadata(
+        self, storing_path: str, backend: str, vectorstore: FAISS
+    ) -> None:
+        """
+        Registra o backend, o modelo e a dimensão dos vetores junto ao índice.
+        """
+        metadata = {
+            "backend": backend,
+            "model": embedding_model_name(self.embed_models[backend]),
+            "dimension": vectorstore.index.d,
+        }
+        with open(os.path.join(storing_path, "embedding.json"), "w") as file:
+            json.dump(metadata, file, indent=2)
+
+    def _check_index_metadata(
+        self, embedding_path: str, backend: str, vectorstore: FAISS
+    ) -> bool:
+        """
+        Verifica se o índice foi gerado pelo mesmo backend, com o mesmo modelo
+        e com a mesma dimensão de vetores. Índices sem metadados são tratados
+        como gerados pelo modelo da Azure.
+        """
+        metadata_path = os.path.join(embedding_path, "embedding.json")
+        if os.path.exists(metadata_path):
+            with open(metadata_path, "r") as file:
+                metadata = json.load(file)
+        else:
+            logger.warning(
+                "Índice sem embedding.json, assumindo backend 'azure': %s",
+                embedding_path,
+            )
+            metadata = {
+                "backend": "azure",
+                "model": config.AZURE_EMBEDDING_MODEL_NAME,
+                "dimension": vectorstore.index.d,
+            }
+
+        embeddings = self.embed_models[backend]
+        model = embedding_model_name(embeddings)
+        dimension = getattr(embeddings, "dimension", None)
+        if metadata["backend"] != backend:
+            logger.error(
+                "Índice %s gerado com o backend '%s', mas a chain usa '%s'",
+                embedding_path, metadata["backend"], backend,
+            )
+            return False
+        if metadata.get("model") != model:
+            logger.error(
+                "Índice %s gerado com o modelo '%s', mas o backend '%s' usa '%s'",
+                embedding_path, metadata.get("model"), backend, model,
+            )
+            return False
+        if metadata["dimension"] != vectorstore.index.d or (
+            dimension is not None and dimension != vectorstore.index.d
+        ):
+            logger.error(
+                "Dimensão dos vetores incompatível no índice %s: %s (índice) x %s (backend)",
+                embedding_path, vectorstore.index.d, dimension or metadata["dimension"],
+            )
+            return False
+        return True
 
     def create_embeddings(
-        self, documents: List[Document], storing_path: str
+        self,
+        documents: List[Document],
+        storing_path: str,
+        backend: str = config.EMBEDDING_BACKEND,
         ) -> Optional[FAISS]:
         """
         Cria embeddings a partir de documentos e os salva localmente.
         """
         try:
-            vectorstore = FAISS.from_documents(documents, self.embed_model)
+            vectorstore = FAISS.from_documents(
+                documents, self.get_embedding_model(backend)
+            )
             vectorstore.save_local(storing_path)
+            self._write_index_metadata(storing_path, backend, vectorstore)
             return vectorstore
         except Exception as e:
             logger.error("Erro ao criar embeddings: %s", e)
             return None
 
     @lru_cache(maxsize=None)
-    def load_embeddings(self, embedding_path: str) -> Optional[FAISS]:
+    def load_embeddings(
+        self, embedding_path: str, backend: str = config.EMBEDDING_BACKEND
+    ) -> Optional[FAISS]:
         """
         Carrega embeddings de um caminho local.
         """
         index_path = os.path.join(embedding_path, "index.faiss")
         if os.path.exists(index_path):
             try:
-                return FAISS.load_local(
+                vectorstore = FAISS.load_local(
                     embedding_path,
-                    self.embed_model,
+                    self.get_embedding_model(backend),
                     allow_dangerous_deserialization=True
                 )
+                if self._check_index_metadata(embedding_path, backend, vectorstore):
+                    return vectorstore
             except Exception as e:
                 logger.error("Erro ao carregar embeddings: %s", e)
         else:
@@ -118,9 +238,12 @@ class EmbeddingProcessor:
             )
         return None
 
-    def create_chain(self, path: str) -> Optional[RetrievalQA]:
+    def create_chain(
+        self, path: str, backend: Optional[str] = None
+    ) -> Optional[RetrievalQA]:
         """
-        Cria uma cadeia de QA usando embeddings no caminho fornecido.
+        Cria uma cadeia de QA usando embeddings no caminho fornecido, com o
+        backend de embeddings da chain (padrão: config.EMBEDDING_BACKEND).
         """
         full_path = os.path.normpath(os.path.join(self.vector_store_path, path))
         
@@ -134,12 +257,18 @@ class EmbeddingProcessor:
             )
             return None
 
-        vectorstore = self.load_embeddings(embedding_path=full_path)
+        vectorstore = self.load_embeddings(
+            embedding_path=full_path, backend=backend or config.EMBEDDING_BACKEND
+        )
         if vectorstore is None:
             return None
 
         retriever = vectorstore.as_retriever(
-            search_type="mmr", search_kwargs={"k": 20, "lambda_mult": 0.5}
+            search_type="mmr",
+            search_kwargs={
+                "k": config.RETRIEVER_K,
+                "lambda_mult": config.RETRIEVER_LAMBDA_MULT,
+            },
         )
 
         return self.load_qa_chain(retriever)
@@ -157,53 +286,236 @@ class EmbeddingProcessor:
         )
 
     @staticmethod
-    def _document_to_dict(doc: Document) -> Dict[str, Any]:
+    def _document_to_dict(
+        doc: Document,
+        citation_mode: str = "full",
+        snippet_chars: int = config.CITATION_SNIPPET_CHARS,
+    ) -> Dict[str, Any]:
         """
-        Converte um objeto de documento em um dicionário.
+        Converte um objeto de documento em um dicionário, incluindo o texto
+        conforme o modo de citação ('metadata', 'snippet' ou 'full').
         """
+        metadata = {
+            "title": doc.metadata.get("title", "Sem título"),
+            # Loaders do LangChain preenchem "source"; a ingestão de PDFs, "file_path"
+            "file_name": os.path.basename(
+                doc.metadata.get("source") or doc.metadata.get("file_path") or "N/A"
+            ),
+            "author": doc.metadata.get("author", "N/A"),
+            "page": int(doc.metadata.get("page", "0")),
+        }
+        if "chain" in doc.metadata:
+            metadata["chain"] = doc.metadata["chain"]
+
+        if citation_mode == "metadata":
+            return {"metadata": metadata}
+
+        page_content = doc.page_content
+        if citation_mode == "snippet":
+            # Descarta o cabeçalho "Documento: ... | Texto do chunk: " gerado na ingestão
+            _, _, text = page_content.partition("Texto do chunk: ")
+            page_content = (text or page_content)[:snippet_chars]
+
         return {
-            "page_content": doc.page_content,
-            "metadata": {
-                "title": doc.metadata.get("title", "Sem título"),
-                "file_name": os.path.basename(doc.metadata.get("source", "N/A")),
-                "author": doc.metadata.get("author", "N/A"),
-                "page": int(doc.metadata.get("page", "0")),
-            },
+            "page_content": page_content,
+            "metadata": metadata,
         }
 
-    def get_response(self, query: str, chain: RetrievalQA) -> Dict[str, Any]:
+    @classmethod
+    def _build_response(
+        cls,
+        query: str,
+        response_content: str,
+        source_documents: List[Document],
+        citation_mode: str = "full",
+        snippet_chars: int = config.CITATION_SNIPPET_CHARS,
+    ) -> Dict[str, Any]:
         """
-        Obtém uma resposta da cadeia de QA para a consulta fornecida.
+        Monta o corpo da resposta com as citações e as mensagens.
         """
-        try:
-            response = chain({"query": query})
-            response_content = response.get("result", str(response))
-
+        if citation_mode == "none":
+            citations = []
+        else:
             citations = [
-                self._document_to_dict(doc)
-                for doc in response["source_documents"]
+                cls._document_to_dict(doc, citation_mode, snippet_chars)
+                for doc in source_documents
             ]
 
-            return {
-                "tool": citations,
-                "messages": [
-                    {"role": "user", "content": query},
-                    {"role": "assistant", "content": response_content},
-                ],
-            }
+        return {
+            "tool": citations,
+            "messages": [
+                {"role": "user", "content": query},
+                {"role": "assistant", "content": response_content},
+            ],
+        }
+
+    def get_response(
+        self,
+        query: str,
+        chain: RetrievalQA,
+        citation_mode: str = "full",
+        snippet_chars: int = config.CITATION_SNIPPET_CHARS,
+        deadline: Optional[float] = None,
+        cancelled: Optional[threading.Event] = None,
+        raise_errors: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Obtém uma resposta da cadeia de QA para a consulta fornecida, dentro
+        do prazo absoluto `deadline` (time.monotonic; por padrão,
+        LLM_REQUEST_TIMEOUT a partir de agora). Se `cancelled` for sinalizado,
+        a espera pelo LLM é interrompida. Em caso de erro, retorna a resposta
+        padrão de `error_response`, ou propaga a exceção com `raise_errors`.
+        """
+        try:
+            with deadline_scope(deadline or self._default_deadline(), cancelled):
+                response = chain({"query": query})
+            response_content = response.get("result", str(response))
+            return self._build_response(
+                query,
+                response_content,
+                response["source_documents"],
+                citation_mode,
+                snippet_chars,
+            )
         except Exception as e:
+            if raise_errors:
+                raise
             logger.error("Erro ao obter resposta: %s", e)
-            return {
-                "tool": [],
-                "messages": [
-                    {"role": "user", "content": query},
-                    {
-                        "role": "assistant",
-                        "content": (
-                            "Peço desculpas, mas encontrei um erro ao processar "
-                            "sua consulta. Poderia tentar reformular sua pergunta "
-                            "ou perguntar outra coisa?"
+            return self.error_response(query)
+
+    def retrieve_merged(
+        self, query: str, chains: Dict[str, RetrievalQA]
+    ) -> List[Document]:
+        """
+        Busca candidatos em todas as chains em paralelo, combina e aplica MMR.
+
+        A consulta é vetorizada uma única vez por backend de embeddings. Se
+        todas as chains usam o mesmo backend, os candidatos estão no mesmo
+        espaço vetorial e o MMR (RETRIEVER_K, RETRIEVER_LAMBDA_MULT, como no
+        retriever de uma chain) é aplicado sobre o conjunto combinado. Com
+        backends diferentes não há como comparar os vetores, então os
+        candidatos são intercalados pela posição em cada chain, sem MMR.
+        """
+        backends = {
+            id(chain.retriever.vectorstore.embeddings): chain.retriever.vectorstore.embeddings
+            for chain in chains.values()
+        }
+        query_vectors = {
+            key: embeddings.embed_query(query) for key, embeddings in backends.items()
+        }
+        mixed_backends = len(query_vectors) > 1
+
+        def search(
+            item: Tuple[str, RetrievalQA]
+        ) -> List[Tuple[Document, Any, np.ndarray]]:
+            name, chain = item
+            vectorstore = chain.retriever.vectorstore
+            query_vector = np.array(
+                [query_vectors[id(vectorstore.embeddings)]], dtype=np.float32
+            )
+            scores, positions = vectorstore.index.search(
+                query_vector, config.FANOUT_K_PER_CHAIN
+            )
+
+            results = []
+            for rank, (score, position) in enumerate(zip(scores[0], positions[0])):
+                if position == -1:
+                    continue
+                doc = vectorstore.docstore.search(
+                    vectorstore.index_to_docstore_id[position]
+                )
+                results.append(
+                    (
+                        Document(
+                            page_content=doc.page_content,
+                            metadata={**doc.metadata, "chain": name},
                         ),
-                    },
-                ],
-            }
+                        (rank, float(score)) if mixed_backends else float(score),
+                        vectorstore.index.reconstruct(int(position)),
+                    )
+                )
+            return results
+
+        workers = max(1, min(config.FANOUT_MAX_WORKERS, len(chains)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            candidates = [
+                result
+                for results in executor.map(search, chains.items())
+                for result in results
+            ]
+
+        candidates.sort(key=lambda result: result[1])
+
+        pool: List[Tuple[Document, np.ndarray]] = []
+        seen = set()
+        for doc, _, vector in candidates:
+            if doc.page_content in seen:
+                continue
+            seen.add(doc.page_content)
+            pool.append((doc, vector))
+
+        if mixed_backends:
+            return [doc for doc, _ in pool[: config.RETRIEVER_K]]
+
+        selected = maximal_marginal_relevance(
+            np.array(next(iter(query_vectors.values())), dtype=np.float32),
+            [vector for _, vector in pool],
+            lambda_mult=config.RETRIEVER_LAMBDA_MULT,
+            k=config.RETRIEVER_K,
+        )
+        return [pool[i][0] for i in selected]
+
+    def get_fanout_response(
+        self,
+        query: str,
+        chains: Dict[str, RetrievalQA],
+        citation_mode: str = "full",
+        snippet_chars: int = config.CITATION_SNIPPET_CHARS,
+        deadline: Optional[float] = None,
+        cancelled: Optional[threading.Event] = None,
+        raise_errors: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Obtém uma resposta única consultando várias chains: a recuperação é
+        feita em paralelo e o LLM é chamado uma só vez com o contexto combinado.
+        Prazo, cancelamento e erros são tratados como em `get_response`.
+        """
+        try:
+            with deadline_scope(deadline or self._default_deadline(), cancelled):
+                documents = self.retrieve_merged(query, chains)
+                combine_chain = next(iter(chains.values())).combine_documents_chain
+                response_content = combine_chain.run(
+                    input_documents=documents, question=query
+                )
+            return self._build_response(
+                query, response_content, documents, citation_mode, snippet_chars
+            )
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error("Erro ao obter resposta (fan-out): %s", e)
+            return self.error_response(query)
+
+    @staticmethod
+    def _default_deadline() -> float:
+        return time.monotonic() + config.LLM_REQUEST_TIMEOUT
+
+    @staticmethod
+    def error_response(query: str) -> Dict[str, Any]:
+        """
+        Resposta padrão quando não é possível responder à consulta.
+        """
+        return {
+            "tool": [],
+            "messages": [
+                {"role": "user", "content": query},
+                {
+                    "role": "assistant",
+                    "content": (
+                        "Peço desculpas, mas encontrei um erro ao processar "
+                        "sua consulta. Poderia tentar reformular sua pergunta "
+                        "ou perguntar outra coisa?"
+                    ),
+                },
+            ],
+        }
@@ -0,0 +1,438 @@
+# functions/llm_client.py
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, Iterator, List, Optional
+
+import httpx
+import openai
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_openai import AzureChatOpenAI
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Erros do upstream que justificam nova tentativa
+TRANSIENT_ERRORS = (
+    openai.APIConnectionError,  # inclui APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+    httpx.TransportError,
+)
+
+# Instante (time.monotonic) em que a requisição atual deixa de ser útil
+request_deadline: ContextVar[Optional[float]] = ContextVar(
+    "request_deadline", default=None
+)
+
+# Sinalizado quando o cliente da requisição atual desconecta
+request_cancelled: ContextVar[Optional[threading.Event]] = ContextVar(
+    "request_cancelled", default=None
+)
+
+# Intervalo (segundos) em que a espera pelo LLM verifica o cancelamento
+CANCEL_POLL_INTERVAL = 0.2
+
+
+class DeadlineExceededError(TimeoutError):
+    """
+    O prazo da requisição expirou antes de uma resposta do LLM.
+    """
+
+
+class RequestCancelledError(RuntimeError):
+    """
+    A requisição foi cancelada (cliente desconectado) antes da resposta do LLM.
+    """
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Todos os deployments do LLM estão com o circuit breaker aberto.
+    """
+
+
+@contextmanager
+def deadline_scope(
+    deadline: float, cancelled: Optional[threading.Event] = None
+) -> Iterator[None]:
+    """
+    Define o prazo absoluto (time.monotonic) das chamadas ao LLM feitas dentro
+    do bloco e, opcionalmente, o evento que as cancela.
+    """
+    deadline_token = request_deadline.set(deadline)
+    cancelled_token = request_cancelled.set(cancelled)
+    try:
+        yield
+    finally:
+        request_cancelled.reset(cancelled_token)
+        request_deadline.reset(deadline_token)
+
+
+def _http_client_options() -> Dict[str, Any]:
+    return {
+        "limits": httpx.Limits(
+            max_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=config.LLM_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(
+            config.LLM_REQUEST_TIMEOUT, connect=config.LLM_CONNECT_TIMEOUT
+        ),
+    }
+
+
+def create_http_client() -> httpx.Client:
+    """
+    Cria um pool de conexões HTTP síncrono com o backend do LLM.
+    """
+    return httpx.Client(**_http_client_options())
+
+
+def create_async_http_client() -> httpx.AsyncClient:
+    """
+    Cria o pool de conexões HTTP assíncrono usado pelo ResilientChatClient.
+    Deve ser usado apenas no event loop do cliente (ResilientChatClient.run).
+    """
+    return httpx.AsyncClient(**_http_client_options())
+
+
+def build_azure_chat(
+    deployment: str,
+    endpoint: str,
+    http_client: Optional[httpx.Client] = None,
+    http_async_client: Optional[httpx.AsyncClient] = None,
+) -> AzureChatOpenAI:
+    """
+    Cria um AzureChatOpenAI sem retries próprios; as novas tentativas ficam a
+    cargo do ResilientChatClient.
+    """
+    return AzureChatOpenAI(
+        api_key=config.AZURE_OPENAI_API_KEY,
+        api_version=config.AZURE_OPENAI_API_VERSION,
+        azure_endpoint=endpoint,
+        azure_deployment=deployment,
+        temperature=config.AZURE_GPT_TEMPERATURE,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        max_retries=0,
+    )
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker simples: abre após `failure_threshold` falhas seguidas e,
+    depois de `reset_timeout` segundos, libera uma única chamada de teste
+    (half-open). As demais continuam falhando rápido até o resultado do teste.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Indica se uma chamada pode ser feita. Quando retorna True com o
+        circuito aberto, a chamada é o teste half-open e deve terminar com
+        `record_success`, `record_failure` ou `release`.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def release(self) -> None:
+        """
+        Encerra o teste half-open sem veredito (ex.: prazo esgotado ou erro
+        que não indica falha do deployment); a próxima chamada testa de novo.
+        """
+        with self._lock:
+            self.probing = False
+
+
+class LatencyTracker:
+    """
+    Janela deslizante das latências das chamadas bem-sucedidas.
+    """
+
+    def __init__(self, window: int = 200) -> None:
+        self.samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self.samples.append(latency)
+
+    def percentile(self, percentile: float, default: float) -> float:
+        with self._lock:
+            if len(self.samples) < config.LLM_HEDGE_MIN_SAMPLES:
+                return default
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+
+class _Target:
+    def __init__(self, name: str, llm: AzureChatOpenAI) -> None:
+        self.name = name
+        self.llm = llm
+        self.breaker = CircuitBreaker(
+            config.LLM_BREAKER_FAILURE_THRESHOLD, config.LLM_BREAKER_RESET_TIMEOUT
+        )
+
+
+class ResilientChatClient(Runnable):
+    """
+    Cliente do LLM com prazo por requisição, hedging, retries com jitter e
+    circuit breaker por deployment. Pode ser usado no lugar do AzureChatOpenAI
+    nas chains do LangChain.
+
+    As chamadas ao LLM rodam (via `ainvoke`) em um event loop próprio, em uma
+    thread dedicada: cancelar a chamada aborta a requisição HTTP em andamento,
+    o que a thread de um `invoke` síncrono não permite.
+    """
+
+    def __init__(
+        self,
+        primary: AzureChatOpenAI,
+        secondary: Optional[AzureChatOpenAI] = None,
+        hedge_enabled: bool = config.LLM_HEDGE_ENABLED,
+        max_retries: int = config.LLM_MAX_RETRIES,
+    ) -> None:
+        self.targets: List[_Target] = [_Target("primary", primary)]
+        if secondary is not None:
+            self.targets.append(_Target("secondary", secondary))
+        self.hedge_enabled = hedge_enabled
+        self.max_retries = max_retries
+        self.latency = LatencyTracker()
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self.loop.run_forever, name="llm-loop", daemon=True
+        )
+        self._loop_thread.start()
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        # `config` aqui é o RunnableConfig do LangChain, não o módulo de configuração
+        deadline = request_deadline.get() or self._default_deadline()
+        cancelled = request_cancelled.get() or threading.Event()
+        attempt = 0
+        while True:
+            try:
+                return self._hedged_call(input, config, deadline, cancelled, kwargs)
+            except TRANSIENT_ERRORS as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                logger.warning(
+                    "Erro transitório no LLM (%s), nova tentativa %d em %.2fs",
+                    e, attempt, delay,
+                )
+                if cancelled.wait(delay):
+                    raise RequestCancelledError("Requisição cancelada pelo cliente")
+
+    @staticmethod
+    def _default_deadline() -> float:
+        return time.monotonic() + config.LLM_REQUEST_TIMEOUT
+
+    @staticmethod
+    def _retry_delay(attempt: int) -> float:
+        """
+        Backoff exponencial com full jitter.
+        """
+        backoff = min(
+            config.LLM_RETRY_MAX_DELAY, config.LLM_RETRY_BASE_DELAY * 2 ** attempt
+        )
+        return random.uniform(0, backoff)
+
+    def _hedged_call(
+        self,
+        input: Any,
+        run_config: Optional[RunnableConfig],
+        deadline: float,
+        cancelled: threading.Event,
+        kwargs: dict,
+    ) -> Any:
+        """
+        Dispara a chamada no primeiro deployment disponível e, se ela passar do
+        p95 das latências recentes, uma segunda chamada (no deployment
+        secundário, se houver). Retorna a primeira resposta bem-sucedida.
+        """
+        # allow() só é consultado para o deployment que será de fato chamado,
+        # pois com o circuito half-open ele reserva a única chamada de teste
+        primary = next((target for target in self.targets if target.breaker.allow()), None)
+        if primary is None:
+            raise CircuitOpenError("Circuit breaker aberto para todos os deployments do LLM")
+
+        pending = {self._submit(primary, input, run_config, deadline, kwargs)}
+        try:
+            hedge_delay = self.latency.percentile(
+                config.LLM_HEDGE_PERCENTILE, config.LLM_HEDGE_DEFAULT_DELAY
+            )
+            done = self._wait(pending, min(hedge_delay, self._remaining(deadline)), cancelled)
+            hedge_target = None
+            if not done and self.hedge_enabled and self._remaining(deadline) > 0:
+                # Prefere o outro deployment; senão repete no mesmo
+                hedge_target = next(
+                    (target for target in reversed(self.targets) if target.breaker.allow()),
+                    None,
+                )
+            if hedge_target is not None:
+                logger.info(
+                    "LLM acima do p95 (%.2fs), disparando hedge em %s",
+                    hedge_delay, hedge_target.name,
+                )
+                pending.add(self._submit(hedge_target, input, run_config, deadline, kwargs))
+
+            error: Optional[BaseException] = None
+            while pending:
+                done = self._wait(pending, self._remaining(deadline), cancelled)
+                if not done:
+                    break
+                pending -= done
+                for future in done:
+                    try:
+                        return future.result()
+                    except Exception as e:
+                        error = e
+            if error is not None:
+                raise error
+            raise DeadlineExceededError("Prazo da requisição ao LLM expirado")
+        finally:
+            # Aborta as chamadas que ainda estão em andamento (hedge perdedor,
+            # prazo esgotado ou cliente desconectado)
+            for future in pending:
+                future.cancel()
+
+    def _submit(
+        self,
+        target: _Target,
+        input: Any,
+        run_config: Optional[RunnableConfig],
+        deadline: float,
+        kwargs: dict,
+    ) -> Future:
+        return asyncio.run_coroutine_threadsafe(
+            self._call(target, input, run_config, deadline, kwargs), self.loop
+        )
+
+    async def _call(
+        self,
+        target: _Target,
+        input: Any,
+        run_config: Optional[RunnableConfig],
+        deadline: float,
+        kwargs: dict,
+    ) -> Any:
+        timeout = self._remaining(deadline)
+        if timeout <= 0:
+            target.breaker.release()
+            raise DeadlineExceededError("Prazo da requisição ao LLM expirado")
+
+        start = time.monotonic()
+        try:
+            result = await target.llm.ainvoke(input, run_config, timeout=timeout, **kwargs)
+        except TRANSIENT_ERRORS as e:
+            if self._is_deployment_failure(e, timeout):
+                target.breaker.record_failure()
+            else:
+                target.breaker.release()
+            raise
+        except BaseException:
+            # Inclui o CancelledError das chamadas abortadas
+            target.breaker.release()
+            raise
+        target.breaker.record_success()
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    def _is_deployment_failure(self, error: BaseException, timeout: float) -> bool:
+        """
+        Um timeout só conta como falha do deployment quando a chamada teve
+        pelo menos LLM_CONNECT_TIMEOUT e o p95 medido das latências recentes;
+        com menos tempo, quem esgotou foi o prazo da própria requisição.
+        """
+        if not isinstance(error, (openai.APITimeoutError, httpx.TimeoutException)):
+            return True
+        floor = max(
+            config.LLM_CONNECT_TIMEOUT,
+            self.latency.percentile(config.LLM_HEDGE_PERCENTILE, 0.0),
+        )
+        return timeout >= floor
+
+    @staticmethod
+    def _wait(pending: set, timeout: float, cancelled: threading.Event) -> set:
+        """
+        Espera a primeira chamada concluir por até `timeout` segundos,
+        interrompendo a espera se a requisição for cancelada.
+        """
+        end = time.monotonic() + timeout
+        while True:
+            remaining = end - time.monotonic()
+            done, _ = wait(
+                pending,
+                timeout=max(0.0, min(CANCEL_POLL_INTERVAL, remaining)),
+                return_when=FIRST_COMPLETED,
+            )
+            if done or remaining <= 0:
+                return done
+            if cancelled.is_set():
+                raise RequestCancelledError("Requisição cancelada pelo cliente")
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        return max(0.0, deadline - time.monotonic())
+
+    def run(self, coroutine: Awaitable, timeout: Optional[float] = None) -> Any:
+        """
+        Executa uma corrotina no event loop do cliente (ex.: operações no pool
+        HTTP assíncrono) e espera o resultado.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def close(self) -> None:
+        """
+        Cancela as chamadas em andamento e encerra o event loop.
+        """
+        async def cancel_pending() -> None:
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.run(cancel_pending(), timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._loop_thread.join()
+        self.loop.close()
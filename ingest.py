@@ -1,5 +1,6 @@
 from functions import document_processor, embedding_processor
 import config
+import json
 import os
 import shutil
 import logging
@@ -16,6 +17,25 @@ def delete_all_in_dir(path: str) -> None:
         elif os.path.isdir(item_path):
             shutil.rmtree(item_path)
 
+def load_embedding_backends(vector_store_path: str) -> dict:
+    """
+    Mapeia o diretório de cada índice ao backend de embeddings da chain no chains.json.
+    """
+    try:
+        with open("api/chains.json", "r") as file:
+            departments_chains = json.load(file)
+    except Exception as error:
+        logger.error(f"Erro ao carregar chains.json: {error}")
+        return {}
+
+    backends = {}
+    for typologies in departments_chains.values():
+        for spec in typologies.values():
+            path, backend = embedding_processor.parse_chain_spec(spec)
+            if backend:
+                backends[os.path.normpath(os.path.join(vector_store_path, path))] = backend
+    return backends
+
 if __name__ == "__main__":
 
     PATH_VECTOR_STORE = config.PATH_VECTOR_STORE
@@ -28,6 +48,7 @@ if __name__ == "__main__":
         chunk_overlap=config.CHUNK_OVERLAP
     )
     embed = embedding_processor.EmbeddingProcessor()
+    embedding_backends = load_embedding_backends(PATH_VECTOR_STORE)
 
     delete_all_in_dir(PATH_VECTOR_STORE)
 
@@ -48,16 +69,20 @@ if __name__ == "__main__":
                 total_documents += len(files)
                 total_chunks += len(documents)
                 
-                vectorstore = embed.create_embeddings(documents, storing_path)
+                backend = embedding_backends.get(os.path.normpath(storing_path), config.EMBEDDING_BACKEND)
+                vectorstore = embed.create_embeddings(documents, storing_path, backend)
 
                 logger.info(f"Sucesso ao processar os documentos da pasta: {root}")
                 logger.info(f"Documentos processados: {len(files)}")
                 logger.info(f"Chunks gerados: {len(documents)}")
+                logger.info(f"Backend de embeddings: {backend}")
             except Exception as error:
                 logger.error(f"Erro ao processar os documentos da pasta {root}. Erro: {error}")
         else:
             logger.info(f"Nenhum arquivo encontrado na pasta {root}. Ignorando...")
 
+    docs.close_pdf_worker()
+
     logger.info("Processamento finalizado!")
     logger.info(f"Total de documentos processados: {total_documents}")
     logger.info(f"Total de chunks gerados: {total_chunks}")
\ No newline at end of file
@@ -2,10 +2,10 @@
 
 import logging
 import os
+from platform import python_version
 
 import uvicorn
 
-from api.server import app
 import config
 
 logging.basicConfig(level=logging.INFO)
@@ -17,6 +17,12 @@ if __name__ == "__main__":
     workers = int(os.getenv("WORKERS", 1))
     log_level = "debug" if config.DEBUG else "info"
 
+    logger.info(
+        "Este projeto foi desenvolvido na versão do Python %s, sua versão atual do Python é a %s",
+        config.PYTHON_VERSION,
+        python_version(),
+    )
+
     logger.info(
         "Iniciando o servidor na porta %d com %d worker(s)", port, workers
     )